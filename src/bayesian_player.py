@@ -1,8 +1,133 @@
+import os
 import chess
-import chess.engine
+import chess.polyglot
 import random
 import pickle
-from umpire import KriegspielUmpire
+import logging
+import numpy as np
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from umpire import KriegspielUmpire, Ann
+
+logger = logging.getLogger(__name__)
+
+# Stockfish search depth used by choose_move
+SEARCH_DEPTH = 12
+# Maximum number of positions kept in the engine transposition table
+TT_MAX_ENTRIES = 100_000
+# Stockfish hash table size (MB), kept warm across turns
+ENGINE_HASH_MB = 256
+
+# Plain-int copies of the umpire.Ann masks used by the per-board filters:
+# bit operations on IntFlag members go through the enum machinery and
+# cost ~60x more than on ints.
+CAPTURE_PAWN = int(Ann.CAPTURE_PAWN)
+CAPTURE_PIECE = int(Ann.CAPTURE_PIECE)
+ILLEGAL = int(Ann.ILLEGAL | Ann.IMPOSSIBLE)
+IN_CHECK = int(Ann.CHECK | Ann.MATE)
+NO_LEGAL_MOVES = int(Ann.MATE | Ann.STALEMATE)
+DRAW = int(Ann.DRAW)
+# Announcements that say something about the board after the move
+POST_MOVE = ILLEGAL | IN_CHECK | NO_LEGAL_MOVES | DRAW
+
+def capture_matches_announcements(board: chess.Board, to_square: chess.Square, flags: int,
+                                  en_passant: bool = False) -> bool:
+    """
+    Check a board *before* a move to to_square is pushed against the
+    capture announcements. The umpire announces every capture together
+    with whether a pawn or a piece stood on the target square, so the
+    target square must hold exactly that, and must be empty if no capture
+    was announced. An en passant move lands on an empty square but is
+    announced as a pawn capture.
+    """
+    if en_passant:
+        return bool(flags & CAPTURE_PAWN)
+    captured = board.piece_type_at(to_square)
+    if flags & CAPTURE_PAWN:
+        return captured == chess.PAWN
+    if flags & CAPTURE_PIECE:
+        return captured is not None and captured != chess.PAWN
+    return captured is None
+
+def board_matches_announcements(board_after: chess.Board, flags: int) -> bool:
+    """
+    Return False if board_after contradicts any of the announcement flags.
+    Captures can't be told apart once the move is on the board; they are
+    checked beforehand by capture_matches_announcements.
+    """
+    if flags & ILLEGAL:
+        # Move was declared illegal in reality,
+        # but we applied it => contradiction
+        return False
+    if flags & (IN_CHECK | NO_LEGAL_MOVES):
+        # The board_after must be in check from the side that moved,
+        # except on stalemate where it must not be. Checkmate comes with
+        # its check direction, so one is_check() covers both.
+        if board_after.is_check() != bool(flags & IN_CHECK):
+            return False
+        if flags & NO_LEGAL_MOVES and any(board_after.generate_legal_moves()):
+            return False
+    if flags & DRAW:
+        # If there's a draw claim, we do minimal checking
+        if not board_after.is_game_over():
+            return False
+    return True
+
+def filter_by_announcements(boards: list, flags: int) -> list:
+    """
+    Return the indices of the boards consistent with the announcement flags.
+    Both belief updates prune through this one kernel.
+    """
+    if not flags & POST_MOVE:
+        # Nothing to test after the move (e.g. a quiet move)
+        return list(range(len(boards)))
+    return [i for i, board in enumerate(boards) if board_matches_announcements(board, flags)]
+
+def expand_on_opponent_move(board: chess.Board, weight: float, opp_final_square: chess.Square, flags: int) -> list:
+    """
+    Apply every opponent move ending on opp_final_square to board and
+    return the resulting (board, weight) pairs consistent with the
+    announcement flags. An empty list means the state can't explain the move.
+    """
+    # Only generate the opponent's (board.turn) legal moves that
+    # end up on opp_final_square, instead of all legal moves.
+    to_mask = chess.BB_SQUARES[opp_final_square]
+    if opp_final_square == board.ep_square:
+        # The en passant square is empty: only an en passant capture
+        # landing there is announced as a pawn capture, anything else
+        # moving there captures nothing
+        if flags & CAPTURE_PIECE:
+            return []
+        if flags & CAPTURE_PAWN:
+            candidate_moves = list(board.generate_legal_ep(to_mask=to_mask))
+        else:
+            candidate_moves = [mv for mv in board.generate_legal_moves(to_mask=to_mask)
+                               if not board.is_en_passant(mv)]
+    elif capture_matches_announcements(board, opp_final_square, flags):
+        # All candidate moves land on opp_final_square, so the capture
+        # announcements can rule out the whole state before generating moves
+        castling_rooks = board.clean_castling_rights() & board.occupied_co[board.turn]
+        if castling_rooks:
+            # python-chess matches castling against the rook's square, not
+            # the king's destination, so also ask for moves onto our own
+            # castling rooks (only castling can land there) and keep those
+            # that really end on opp_final_square
+            candidate_moves = [mv for mv in board.generate_legal_moves(to_mask=to_mask | castling_rooks)
+                               if mv.to_square == opp_final_square]
+        else:
+            candidate_moves = list(board.generate_legal_moves(to_mask=to_mask))
+    else:
+        return []
+    new_boards = []
+    last = len(candidate_moves) - 1
+    for i, mv in enumerate(candidate_moves):
+        # The parent state is discarded after expansion, so the last branch
+        # reuses its board in place. We never look at the move history,
+        # so the other branches don't copy the move stack.
+        new_board = board if i == last else board.copy(stack=False)
+        new_board.push(mv)
+        new_boards.append(new_board)
+    return [(new_boards[i], weight) for i in filter_by_announcements(new_boards, flags)]
 
 class BayesianAgent:
     def __init__(self, 
@@ -10,246 +135,189 @@ class BayesianAgent:
                  stockfish_path: str, 
                  max_states: int = 2000,
                  use_dataset_init: bool = False,
-                 dataset_file: str = "belief_states_cpts.pickle"):
+                 dataset_file: str = "belief_states_cpts.pickle",
+                 num_engines: int = 4,
+                 engine_threads: int = None,
+                 engine_hash_mb: int = ENGINE_HASH_MB):
         """
         If use_dataset_init=True, we load our initial belief states
         from the specified pickle file (dataset_file).
         Otherwise, we start from a single standard chess position.
 
         :param umpire: The KriegspielUmpire object with the ground-truth board
-        :param stockfish_path: Path to the Stockfish (or other UCI) engine
+        :param stockfish_path: Path to the Stockfish (or other UCI) engine; without one, choose_move plays randomly
         :param max_states: Maximum number of states we keep in our belief set
         :param use_dataset_init: Whether to load the initial belief from a pickle
         :param dataset_file: Path to the pickle file containing the initial belief
+        :param num_engines: Number of engine processes; choose_move analyses this many top belief states in parallel
+        :param engine_threads: Threads per engine (defaults to sharing all but one core between the engines)
+        :param engine_hash_mb: Hash table size (MB) of each engine
         """
         self.umpire = umpire
         self.max_states = max_states
-        self.engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
+        self.use_dataset_init = use_dataset_init
+        self.dataset_file = dataset_file
+        self.engines = []
+        self.executor = None
+        if stockfish_path:
+            # chess.engine pulls in asyncio and subprocess handling,
+            # so only import it when there is an engine to talk to
+            from chess.engine import Limit, SimpleEngine
+            self.limit = Limit(depth=SEARCH_DEPTH)
+            self.engines = [SimpleEngine.popen_uci(stockfish_path) for _ in range(num_engines)]
+            # Give the engines a useful hash table and share the spare cores
+            # (one is left for this process) between them
+            if engine_threads is None:
+                engine_threads = max(1, ((os.cpu_count() or 1) - 1) // num_engines)
+            for engine in self.engines:
+                engine.configure({"Hash": engine_hash_mb, "Threads": engine_threads})
+            # Each engine is its own process, so threads are enough to run them concurrently
+            self.executor = ThreadPoolExecutor(max_workers=num_engines)
+        # Transposition table of engine results across turns:
+        # Zobrist hash -> (best move, search depth)
+        self.tt = {}
+        # Changing this token makes python-chess send "ucinewgame"
+        self.game = object()
+
+        # Loaded once; reset_beliefs copies them for every game
+        self.initial_boards, self.initial_weights = self.load_initial_beliefs()
+        self.reset_beliefs()
 
-        if use_dataset_init:
+    def load_initial_beliefs(self):
+        """
+        Load the initial belief states once: from the dataset pickle if
+        use_dataset_init was set, else the standard starting position.
+        Returns (boards, weights).
+        """
+        if self.use_dataset_init:
             # Load belief states from the pickle file
             try:
-                with open(dataset_file, "rb") as f:
-                    self.belief_states = pickle.load(f)
-                print(f"Loaded {len(self.belief_states)} belief states from {dataset_file}.")
+                with open(self.dataset_file, "rb") as f:
+                    belief_states = pickle.load(f)
+                boards = [s["board"] for s in belief_states]
+                weights = np.array([s["weight"] for s in belief_states], dtype=np.float32)
+                logger.info("Loaded %d belief states from %s.", len(boards), self.dataset_file)
+                return boards, weights
             except Exception as e:
-                print(f"Error loading belief states from {dataset_file}: {e}")
-                print("Falling back to standard single-board initialization.")
-                self.belief_states = [{
-                    "board": chess.Board(),  # standard chess start
-                    "weight": 1.0
-                }]
-        else:
-            # Default to a single known state (standard chess starting position)
-            self.belief_states = [{
-                "board": chess.Board(),
-                "weight": 1.0
-            }]
+                logger.warning("Error loading belief states from %s: %s", self.dataset_file, e)
+                logger.warning("Falling back to standard single-board initialization.")
+        # Default to a single known state (standard chess starting position)
+        return [chess.Board()], np.array([1.0], dtype=np.float32)
+
+    def reset_beliefs(self):
+        """
+        Start a game from (a copy of) the initial belief states. Belief
+        updates push moves onto the boards in place, so each game gets
+        its own boards.
+        """
+        self.boards = [board.copy() for board in self.initial_boards]
+        self.weights = self.initial_weights.copy()
+
+    def new_game(self, umpire: KriegspielUmpire):
+        """
+        Reuse this agent (and its running engines) for another game
+        refereed by umpire. The engine transposition table is kept, since
+        positions don't depend on the game they occur in.
+        """
+        self.umpire = umpire
+        self.game = object()
+        self.reset_beliefs()
 
     def normalize_beliefs(self):
-        total = sum(s["weight"] for s in self.belief_states)
+        total = self.weights.sum()
         if total > 0:
-            for s in self.belief_states:
-                s["weight"] /= total
+            self.weights /= total
         else:
             # If total = 0, all states are invalid
-            self.belief_states = []
+            self.boards = []
+            self.weights = np.empty(0, dtype=np.float32)
 
     def prune_states(self):
         # If we have more than self.max_states, prune the lowest-weight ones
-        if len(self.belief_states) <= self.max_states:
+        if len(self.boards) <= self.max_states:
             return
-        # Sort states by descending weight
-        self.belief_states.sort(key=lambda s: s["weight"], reverse=True)
-        self.belief_states = self.belief_states[:self.max_states]
+        # Keep the max_states highest-weight states (O(n) partition, no sort)
+        idx = np.argpartition(self.weights, -self.max_states)[-self.max_states:]
+        self.boards = [self.boards[i] for i in idx]
+        self.weights = self.weights[idx]
         self.normalize_beliefs()
 
-    def update_belief_on_opponent_move(self, opp_final_square: chess.Square, announcements: list):
+    def update_belief_on_opponent_move(self, opp_final_square: chess.Square, flags: int):
         """
         The opponent has just moved. We know the final square of that move
-        (opp_final_square) and the announcements.
+        (opp_final_square) and the announcement flags (see umpire.Ann).
         We regenerate belief states accordingly.
         """
-        new_belief_states = []
+        flags = int(flags)  # see CAPTURE_PAWN etc.
+        # Different opponent moves can transpose into the same position.
+        # Index the new states by Zobrist hash so transpositions sum their
+        # weights instead of being filtered (and pruned) twice.
+        index_of = {}
+        new_boards = []
+        new_weights = []
 
-        for state in self.belief_states:
-            board = state["board"]
-            w = state["weight"]
+        for board, weight in zip(self.boards, self.weights):
+            for new_board, w in expand_on_opponent_move(board, float(weight),
+                                                        opp_final_square, flags):
+                key = chess.polyglot.zobrist_hash(new_board)
+                i = index_of.get(key)
+                if i is not None:
+                    new_weights[i] += w
+                else:
+                    index_of[key] = len(new_boards)
+                    new_boards.append(new_board)
+                    new_weights.append(w)
 
-            # Gather all legal moves in this hypothetical board
-            legal_moves = list(board.legal_moves)
-
-            candidate_moves = []
-            for mv in legal_moves:
-                # We want moves by the opponent (board.turn).
-                # If that piece ends up on opp_final_square, we consider it.
-                if mv.to_square == opp_final_square and board.color_at(mv.from_square) == board.turn:
-                    candidate_moves.append(mv)
-
-            if not candidate_moves:
-                # This state can't explain the opponent's final square => prune it
-                continue
-
-            # For each candidate move, create a new board state
-            for mv in candidate_moves:
-                new_board = board.copy()
-                new_board.push(mv)
-                new_belief_states.append({
-                    "board": new_board,
-                    "weight": w
-                })
-
-        # Now apply the announcements to prune or adjust weights
-        filtered_states = []
-        for s in new_belief_states:
-            board_after = s["board"]
-            keep_it = True
-
-            for ann in announcements:
-                if ann.startswith("Pawn gone on "):
-                    sq_str = ann.split()[-1]  # e.g. "d4"
-                    sq = chess.parse_square(sq_str)
-                    piece_captured = board_after.piece_at(sq)
-                    # If there's a piece, it must be a pawn of the captured side
-                    if piece_captured is not None and piece_captured.piece_type != chess.PAWN:
-                        keep_it = False
-                        break
-                    if piece_captured is None:
-                        keep_it = False
-                        break
-                elif ann.startswith("Piece gone on "):
-                    sq_str = ann.split()[-1]
-                    sq = chess.parse_square(sq_str)
-                    piece_captured = board_after.piece_at(sq)
-                    # If there's a piece, it must NOT be a pawn
-                    if piece_captured is not None and piece_captured.piece_type == chess.PAWN:
-                        keep_it = False
-                        break
-                    if piece_captured is None:
-                        keep_it = False
-                        break
-                elif ann in ["Hell no", "No"]:
-                    # Move was declared illegal in reality, 
-                    # but we applied it => contradiction
-                    keep_it = False
-                    break
-                elif ann.startswith("Check"):
-                    # The board_after must be in check from the side that moved
-                    if not board_after.is_check():
-                        keep_it = False
-                        break
-                elif ann == "Checkmate":
-                    if not board_after.is_checkmate():
-                        keep_it = False
-                        break
-                elif ann == "Stalemate":
-                    if not board_after.is_stalemate():
-                        keep_it = False
-                        break
-                elif ann.startswith("draw"):
-                    # If there's a draw claim, we do minimal checking
-                    if not board_after.is_game_over():
-                        keep_it = False
-                        break
-                # "White to move"/"Black to move" not strictly needed for pruning
-
-            if keep_it:
-                filtered_states.append(s)
-
-        self.belief_states = filtered_states
+        self.boards = new_boards
+        self.weights = np.array(new_weights, dtype=np.float32)
         self.normalize_beliefs()
         self.prune_states()
 
-    def update_belief_on_own_move_feedback(self, move: chess.Move, success: bool, announcements: list):
+    def update_belief_on_own_move_feedback(self, move: chess.Move, success: bool, flags: int):
         """
         After we attempt a move, the umpire might say 'No'/'Hell no' (illegal)
         or we get captures/check etc. We'll prune states accordingly.
         """
+        flags = int(flags)  # see CAPTURE_PAWN etc.
         if not success:
-            # Real board says illegal => 
+            # Real board says illegal =>
             # prune states where the move would have been legal
-            new_belief = []
-            for s in self.belief_states:
-                board = s["board"]
-                if move in board.legal_moves:
-                    continue  # this state conflicts with reality
-                new_belief.append(s)
-            self.belief_states = new_belief
-            self.normalize_beliefs()
-            self.prune_states()
-            return
-
-        # If success = True, apply the move to each consistent state
-        new_belief_states = []
-        for state in self.belief_states:
-            board = state["board"]
-            if move in board.legal_moves:
-                new_board = board.copy()
-                new_board.push(move)
-                new_belief_states.append({
-                    "board": new_board,
-                    "weight": state["weight"]
-                })
-
-        # Now apply the announcements for further pruning
-        filtered_states = []
-        for s in new_belief_states:
-            board_after = s["board"]
-            keep_it = True
-
-            for ann in announcements:
-                if ann.startswith("Pawn gone on "):
-                    sq_str = ann.split()[-1]
-                    sq = chess.parse_square(sq_str)
-                    piece_captured = board_after.piece_at(sq)
-                    if piece_captured is not None and piece_captured.piece_type != chess.PAWN:
-                        keep_it = False
-                        break
-                    if piece_captured is None:
-                        keep_it = False
-                        break
-                elif ann.startswith("Piece gone on "):
-                    sq_str = ann.split()[-1]
-                    sq = chess.parse_square(sq_str)
-                    piece_captured = board_after.piece_at(sq)
-                    if piece_captured is not None and piece_captured.piece_type == chess.PAWN:
-                        keep_it = False
-                        break
-                    if piece_captured is None:
-                        keep_it = False
-                        break
-                elif ann.startswith("Check"):
-                    if not board_after.is_check():
-                        keep_it = False
-                        break
-                elif ann == "Checkmate":
-                    if not board_after.is_checkmate():
-                        keep_it = False
-                        break
-                elif ann == "Stalemate":
-                    if not board_after.is_stalemate():
-                        keep_it = False
-                        break
-                elif ann.startswith("draw"):
-                    if not board_after.is_game_over():
-                        keep_it = False
-                        break
-
-            if keep_it:
-                filtered_states.append(s)
+            # (those states conflict with reality)
+            keep = [i for i, board in enumerate(self.boards) if move not in board.legal_moves]
+        else:
+            # If success = True, apply the move to each consistent state.
+            # The old states are replaced wholesale, so push in place,
+            # then apply the announcements for further pruning.
+            moved = []
+            for i, board in enumerate(self.boards):
+                if move not in board.legal_moves:
+                    continue
+                if board.is_castling(move):
+                    # Castling never captures, even when written as the
+                    # king taking its own rook (e.g. e1h1)
+                    if flags & (CAPTURE_PAWN | CAPTURE_PIECE):
+                        continue
+                elif not capture_matches_announcements(board, move.to_square, flags,
+                                                       board.is_en_passant(move)):
+                    continue
+                board.push(move)
+                moved.append(i)
+            matching = filter_by_announcements([self.boards[i] for i in moved], flags)
+            keep = [moved[j] for j in matching]
 
-        self.belief_states = filtered_states
+        self.boards = [self.boards[i] for i in keep]
+        self.weights = self.weights[keep]
         self.normalize_beliefs()
         self.prune_states()
 
     def choose_move(self):
         """
         Choose our next move:
-         - If we have no belief states, do random fallback using the real board.
-         - Otherwise, pick the highest-weight state, feed it into Stockfish,
-           and return the recommended move.
+         - If we have no belief states (or no engine), do random fallback using the real board.
+         - Otherwise, feed the highest-weight states into Stockfish in parallel
+           (one engine each) and return the move with the largest total weight.
         """
-        if not self.belief_states:
+        if not self.boards or not self.engines:
             # Fallback: random from the ground-truth board
             board_real = self.umpire.board
             legal_moves = list(board_real.legal_moves)
@@ -258,14 +326,55 @@ class BayesianAgent:
             else:
                 return None
 
-        # Otherwise, pick the highest-prob state
-        self.belief_states.sort(key=lambda s: s["weight"], reverse=True)
-        best_state = self.belief_states[0]
-        board_for_engine = best_state["board"].copy()
+        # Otherwise, pick the highest-prob states, one per engine
+        k = min(len(self.engines), len(self.boards))
+        top = np.argpartition(self.weights, -k)[-k:]
+        top_boards = [self.boards[i] for i in top]
+        top_weights = self.weights[top]
+        keys = [chess.polyglot.zobrist_hash(board) for board in top_boards]
+
+        # Positions we already searched deep enough on an earlier turn come
+        # straight from the transposition table; the rest go to the engines.
+        moves = [None] * k
+        futures = {}
+        engines = iter(self.engines)
+        for i, (board, key) in enumerate(zip(top_boards, keys)):
+            entry = self.tt.get(key)
+            if entry is not None and entry[1] >= SEARCH_DEPTH:
+                moves[i] = entry[0]
+            else:
+                futures[i] = self.executor.submit(next(engines).play, board, self.limit, game=self.game)
+        for i, future in futures.items():
+            moves[i] = future.result().move
+            self.store_engine_result(keys[i], moves[i], SEARCH_DEPTH)
 
-        # Use Stockfish
-        result = self.engine.play(board_for_engine, limit=chess.engine.Limit(depth=12))
-        return result.move
+        # Weighted vote over the engines' recommendations
+        votes = Counter()
+        for weight, move in zip(top_weights, moves):
+            if move is not None:
+                votes[move] += float(weight)
+        if not votes:
+            return None
+        return votes.most_common(1)[0][0]
+
+    def store_engine_result(self, key: int, move: chess.Move, depth: int):
+        """
+        Insert an engine result into the transposition table. An existing
+        entry is only replaced by a search that went at least as deep, and
+        the oldest entry is evicted once the table is full.
+        """
+        entry = self.tt.get(key)
+        if entry is not None:
+            if depth >= entry[1]:
+                self.tt[key] = (move, depth)
+            return
+        if len(self.tt) >= TT_MAX_ENTRIES:
+            # dicts keep insertion order, so the first key is the oldest
+            del self.tt[next(iter(self.tt))]
+        self.tt[key] = (move, depth)
 
     def shutdown_engine(self):
-        self.engine.quit()
+        for engine in self.engines:
+            engine.quit()
+        if self.executor is not None:
+            self.executor.shutdown()
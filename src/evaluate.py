@@ -1,5 +1,6 @@
 import argparse
-from main import play_kriegspiel
+import logging
+from main import run_batch
 
 def main():
     # Set up argument parsing
@@ -15,12 +16,14 @@ def main():
     )
     args = parser.parse_args()
 
+    # Only per-game results; per-move logging is debug level
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
     wins = 0
     draws = 0
     losses = 0
 
-    for _ in range(args.times):
-        result = play_kriegspiel("/opt/homebrew/bin/stockfish")
+    for result in run_batch(args.times, "/opt/homebrew/bin/stockfish"):
         if result == "win":
             wins += 1
         elif result == "draw":
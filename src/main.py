@@ -1,18 +1,39 @@
+import os
 import sys
+import logging
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor
 import chess
-from umpire import KriegspielUmpire
+from umpire import KriegspielUmpire, describe_announcements
 from random_player import RandomAgent
-from bayesian_player import BayesianAgent
+from bayesian_player import BayesianAgent, ENGINE_HASH_MB
 
-def play_kriegspiel(stockfish_path: str, use_dataset_init: bool = False, max_states: int = 2000):
+logger = logging.getLogger(__name__)
+
+# Default cap on run_batch worker processes (one agent and engine each)
+BATCH_MAX_WORKERS = 8
+# Stockfish's own default hash size (MB), the least a batch engine gets
+BATCH_MIN_HASH_MB = 16
+
+def play_kriegspiel(stockfish_path: str, use_dataset_init: bool = False, max_states: int = 2000,
+                    white_agent: BayesianAgent = None):
+    """
+    Play one game of the Bayesian agent (White) against the random bot.
+    If white_agent is given it is reused (and left running) instead of
+    starting a new agent and engine for this game.
+    """
     umpire = KriegspielUmpire()
 
-    white_agent = BayesianAgent(
-        umpire,
-        stockfish_path=stockfish_path,
-        max_states=max_states,
-        use_dataset_init=use_dataset_init
-    )
+    own_agent = white_agent is None
+    if own_agent:
+        white_agent = BayesianAgent(
+            umpire,
+            stockfish_path=stockfish_path,
+            max_states=max_states,
+            use_dataset_init=use_dataset_init
+        )
+    else:
+        white_agent.new_game(umpire)
     # black_bot = BayesianAgent(
     #     umpire,
     #     stockfish_path=stockfish_path,
@@ -21,63 +42,41 @@ def play_kriegspiel(stockfish_path: str, use_dataset_init: bool = False, max_sta
     # )
     black_bot = RandomAgent(umpire)
 
-    move_counter = 1
+    # Decided once per game: formatting only happens if debug logging is on
+    verbose = logger.isEnabledFor(logging.DEBUG)
 
     while not umpire.game_over:
         current_color = umpire.get_active_color()
         if current_color == "White":
             move = white_agent.choose_move()
             if move is None:
-                print("White has no moves or agent gave None.")
+                logger.info("White has no moves or agent gave None.")
                 break
 
-            success, announcements, final_sq = umpire.move(move)
+            success, flags, final_sq, capture_sq = umpire.move(move)
             # White processes own move feedback
-            white_agent.update_belief_on_own_move_feedback(move, success, announcements)
+            white_agent.update_belief_on_own_move_feedback(move, success, flags)
 
-            # Print or log
-            print(f"{move_counter}. White plays {move}, success={success}")
-            for ann in announcements:
-                print("   Announcement:", ann)
+            if verbose:
+                logger.debug("%d. White plays %s, success=%s", umpire.board.fullmove_number, move, success)
+                for ann in describe_announcements(flags, capture_sq):
+                    logger.debug("   Announcement: %s", ann)
 
         # black: random bot
         else:
-            black_bot.choose_move()
-            success = not umpire.board.is_game_over()
-            # The partial-info agent sees the final square of black's move if success
-            # But we need to capture the last move from the ground-truth board:
-            last_move = umpire.board.peek() if umpire.board.move_stack else None
-
-            if last_move and not umpire.game_over:
-                # Gather announcements from the *last* move
-                # In our design, we get them from black_bot's 'make_move' 
-                # but we didn't store them there. Let's store them now:
-                # Actually, to keep it consistent, let's do a slight refactor:
-                # For demonstration, let's assume we re-run the move or 
-                # intercept the announcements in black_bot. 
-                # We'll do a quick hack: no direct announcements for the partial-info agent 
-                # unless we refactor RandomBot. 
-                pass
-
-                # We'll just get final square from last move
-                opp_final_square = last_move.to_square
-                # The White agent doesn't know exactly which piece moved, 
-                # but it does know the final square (opp_final_square).
-                # We'll assume we can't easily get the announcements unless 
-                # we do more hooking. For demonstration, let's feed empty announcements.
-                announcements = []  # In real code, we'd properly hook in the results.
-
-                # White updates its beliefs
-                white_agent.update_belief_on_opponent_move(opp_final_square, announcements)
-
-            # print(f"{move_counter}. Black (Random) played.")
-        
-        move_counter += 1
-        if umpire.game_over:
-            break
-
-    print("Game over. Result:", umpire.result if umpire.result else "Unknown")
-    white_agent.shutdown_engine() # shutdown stockfish
+            success, flags, opp_final_square, _ = black_bot.choose_move(verbose=verbose)
+
+            if success and not umpire.game_over:
+                # The White agent doesn't know exactly which piece moved,
+                # but it does know the final square and the announcements,
+                # straight from the umpire's reply to Black.
+                white_agent.update_belief_on_opponent_move(opp_final_square, flags)
+
+            # print(f"{umpire.board.fullmove_number}. Black (Random) played.")
+
+    logger.info("Game over. Result: %s", umpire.result if umpire.result else "Unknown")
+    if own_agent:
+        white_agent.shutdown_engine() # shutdown stockfish
 
     if umpire.result == "1-0":
         return "win"
@@ -89,7 +88,54 @@ def play_kriegspiel(stockfish_path: str, use_dataset_init: bool = False, max_sta
         return "unknown"
 
 
+# The persistent agent of a run_batch worker process
+_batch_agent = None
+
+def _init_batch_worker(stockfish_path: str, use_dataset_init: bool, max_states: int,
+                       engine_hash_mb: int):
+    global _batch_agent
+    # Games already run in parallel, one per core, so each worker gets a
+    # single single-threaded engine with its share of the hash
+    _batch_agent = BayesianAgent(
+        KriegspielUmpire(),
+        stockfish_path=stockfish_path,
+        max_states=max_states,
+        use_dataset_init=use_dataset_init,
+        num_engines=1,
+        engine_threads=1,
+        engine_hash_mb=engine_hash_mb
+    )
+    # Quit the engine when the worker exits (atexit doesn't run in pool workers)
+    multiprocessing.util.Finalize(None, _batch_agent.shutdown_engine, exitpriority=10)
+
+def _play_batch_game(_) -> str:
+    return play_kriegspiel(None, white_agent=_batch_agent)
+
+def run_batch(n_games: int, stockfish_path: str, workers: int = None,
+              use_dataset_init: bool = False, max_states: int = 2000) -> list:
+    """
+    Play n_games games in parallel worker processes and return their
+    results ("win"/"draw"/"loss"/"unknown"). Each worker keeps one agent
+    and engine alive across all the games it plays. workers defaults to
+    one per core, at most BATCH_MAX_WORKERS, and the engines split
+    ENGINE_HASH_MB between them rather than taking that much each.
+    """
+    workers = workers or min(os.cpu_count() or 1, BATCH_MAX_WORKERS)
+    workers = max(1, min(workers, n_games))
+    engine_hash_mb = max(BATCH_MIN_HASH_MB, ENGINE_HASH_MB // workers)
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_batch_worker,
+                             initargs=(stockfish_path, use_dataset_init, max_states,
+                                       engine_hash_mb)) as executor:
+        return list(executor.map(_play_batch_game, range(n_games)))
+
+
 if __name__ == "__main__":
+    # A single game from the command line shows every move
+    # (but not python-chess's engine chatter, which is also debug level)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for name in (__name__, "random_player"):
+        logging.getLogger(name).setLevel(logging.DEBUG)
     stockfish_path = sys.argv[1] if len(sys.argv) > 1 else "/opt/homebrew/bin/stockfish"
     use_dataset_init = bool(sys.argv[2]) if len(sys.argv) > 2 else False
     play_kriegspiel(stockfish_path, use_dataset_init, max_states=2000)
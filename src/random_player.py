@@ -1,23 +1,52 @@
 import random
-from umpire import KriegspielUmpire
+import logging
+from umpire import KriegspielUmpire, Ann, describe_announcements
+
+logger = logging.getLogger(__name__)
 
 class RandomAgent:
-    def __init__(self, umpire: KriegspielUmpire):
+    __slots__ = ("umpire", "_rng")
+
+    def __init__(self, umpire: KriegspielUmpire, seed=None):
         self.umpire = umpire
+        # Own generator: reproducible games with a seed, and no shared module state
+        self._rng = random.Random(seed)
 
-    def choose_move(self):
+    def choose_move(self, *, verbose=False):
+        """
+        Play a uniformly random legal move on the umpire's board.
+        Returns the umpire's (success, flags, final_square, capture_square),
+        or (False, Ann(0), None, None) if there is no move to play.
+        The move and its announcements are only logged when verbose is set.
+        """
         if self.umpire.game_over:
-            return
+            return False, Ann(0), None, None
 
         board = self.umpire.board  # The ground truth
-        legal_moves = list(board.legal_moves)
-        if not legal_moves:
-            return
 
-        move = random.choice(legal_moves)
-        success, announcements, final_square = self.umpire.move(move)
-        print(f"Black plays {move}, success={success}")
-        for ann in announcements:
-            print("   Announcement:", ann)
-        # We could print or log the announcements if desired
-        # For now, let's just ignore them in RandomBot
\ No newline at end of file
+        # Rejection sampling: a uniform pick among the pseudo-legal moves,
+        # kept only if it is legal, is a uniform pick among the legal moves.
+        # Outside of check nearly every pseudo-legal move is legal, so this
+        # skips the king-safety test for all the moves we don't play.
+        move = None
+        randrange = self._rng.randrange
+        pseudo_legal_moves = list(board.generate_pseudo_legal_moves())
+        n = len(pseudo_legal_moves)
+        for _ in range(n):
+            candidate = pseudo_legal_moves[randrange(n)]
+            if not board.is_into_check(candidate):
+                move = candidate
+                break
+        if move is None:
+            # Unlucky (or in check with few evasions): pick from the legal moves
+            legal_moves = list(board.legal_moves)
+            if not legal_moves:
+                return False, Ann(0), None, None
+            move = legal_moves[randrange(len(legal_moves))]
+
+        success, flags, final_square, capture_square = self.umpire.move(move)
+        if verbose and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Black plays %s, success=%s", move, success)
+            for ann in describe_announcements(flags, capture_square):
+                logger.debug("   Announcement: %s", ann)
+        return success, flags, final_square, capture_square
@@ -1,12 +1,98 @@
 import chess
-import chess.engine
+import chess.polyglot
+from enum import IntFlag
+
+class Ann(IntFlag):
+    """
+    Umpire announcements, as bits of the flags returned by
+    KriegspielUmpire.move. Use describe_announcements to turn them
+    back into the umpire's words.
+    """
+    CAPTURE_PAWN = 1
+    CAPTURE_PIECE = 2
+    CHECK_VERT = 4
+    CHECK_HORIZ = 8
+    CHECK_LONG_DIAG = 16
+    CHECK_SHORT_DIAG = 32
+    CHECK_KNIGHT = 64
+    MATE = 128
+    STALEMATE = 256
+    DRAW = 512
+    ILLEGAL = 1024     # "No"
+    IMPOSSIBLE = 2048  # "Hell no"
+
+    CAPTURE = CAPTURE_PAWN | CAPTURE_PIECE
+    CHECK = CHECK_VERT | CHECK_HORIZ | CHECK_LONG_DIAG | CHECK_SHORT_DIAG | CHECK_KNIGHT
+
+# DIAG_KIND[a * 64 + b] classifies the diagonal between squares a and b:
+# DIAG_LONG if they are 3 or more files apart, DIAG_SHORT if closer,
+# DIAG_NONE if they don't share a diagonal
+DIAG_NONE, DIAG_LONG, DIAG_SHORT = 0, 1, 2
+DIAG_KIND = bytearray(64 * 64)
+for _a in chess.SQUARES:
+    for _b in chess.SQUARES:
+        _file_diff = abs(chess.square_file(_a) - chess.square_file(_b))
+        if _a != _b and _file_diff == abs(chess.square_rank(_a) - chess.square_rank(_b)):
+            DIAG_KIND[_a * 64 + _b] = DIAG_LONG if _file_diff >= 3 else DIAG_SHORT
+del _a, _b, _file_diff
+
+# What the umpire announces for each way a game can end
+TERMINATION_FLAGS = {
+    chess.Termination.CHECKMATE: Ann.MATE,
+    chess.Termination.STALEMATE: Ann.STALEMATE,
+    chess.Termination.INSUFFICIENT_MATERIAL: Ann.DRAW,
+    chess.Termination.SEVENTYFIVE_MOVES: Ann.DRAW,
+    chess.Termination.FIVEFOLD_REPETITION: Ann.DRAW,
+    chess.Termination.FIFTY_MOVES: Ann.DRAW,
+    chess.Termination.THREEFOLD_REPETITION: Ann.DRAW,
+}
+
+# What the umpire says for each announcement bit, in the order it says
+# them. Captures are followed by the square, e.g. "Pawn gone on e4".
+ANN_STR = (
+    (int(Ann.IMPOSSIBLE), "Hell no"),
+    (int(Ann.ILLEGAL), "No"),
+    (int(Ann.CAPTURE_PAWN), "Pawn gone on "),
+    (int(Ann.CAPTURE_PIECE), "Piece gone on "),
+    (int(Ann.CHECK_VERT), "Check on the vertical"),
+    (int(Ann.CHECK_HORIZ), "Check on the horizontal"),
+    (int(Ann.CHECK_LONG_DIAG), "Check on the long diagonal"),
+    (int(Ann.CHECK_SHORT_DIAG), "Check on the short diagonal"),
+    (int(Ann.CHECK_KNIGHT), "Check by a knight"),
+    (int(Ann.MATE), "Checkmate"),
+    (int(Ann.STALEMATE), "Stalemate"),
+    (int(Ann.DRAW), "Draw"),
+)
+_CAPTURE_BITS = int(Ann.CAPTURE)
+
+def describe_announcements(flags: int, capture_square: chess.Square = None) -> list:
+    """
+    The announcements in flags as the umpire would say them, e.g.
+    ["Pawn gone on e4", "Check on the vertical"].
+    """
+    flags = int(flags)
+    announcements = []
+    for bit, text in ANN_STR:
+        if flags & bit:
+            if bit & _CAPTURE_BITS:
+                text += chess.square_name(capture_square)
+            announcements.append(text)
+    return announcements
 
 class KriegspielUmpire:
+    __slots__ = ("board", "game_over", "result")
+
     def __init__(self):
         self.board = chess.Board()
         self.game_over = False
         self.result = None
 
+    def key(self) -> int:
+        """
+        Zobrist hash of the ground-truth board, computed on demand.
+        """
+        return chess.polyglot.zobrist_hash(self.board)
+
     def get_active_color(self):
         return "White" if self.board.turn == chess.WHITE else "Black"
 
@@ -30,125 +116,117 @@ class KriegspielUmpire:
         
         # We'll do a quick geometry check:
         #   If the board says it's not a pseudo-legal move for that piece, call it impossible.
-        if move not in self.board.generate_pseudo_legal_moves():
-            return True
-        return False
+        #   is_pseudo_legal tests the target square against python-chess's
+        #   precomputed attack tables (knight/king/pawn masks, sliding rays),
+        #   so no moves are generated.
+        return not self.board.is_pseudo_legal(move)
 
     def move(self, move: chess.Move):
         """
         Attempt to apply the move to the ground-truth board.
         Returns a tuple:
-          (success: bool, announcements: list[str], final_square: chess.Square or None)
-        If success=False, we either have "No" or "Hell no".
-        If success=True, announcements may include captures, checks, etc.
+          (success: bool, flags: Ann, final_square: chess.Square or None,
+           capture_square: chess.Square or None)
+        If success=False, flags is either Ann.ILLEGAL ("No") or
+        Ann.IMPOSSIBLE ("Hell no").
+        If success=True, flags may include captures, checks, etc.
         final_square is the destination square if success=True, else None.
+        capture_square is where a piece was captured, if any.
+        Everything returned is announced to both players, so an opponent's
+        agent can take final_square and flags as they are, without looking
+        at the board.
         """
-        announcements = []
+        # Bind the board (and what we use of chess) to locals once:
+        # this runs every ply, and each self.board.X is two attribute loads
+        board = self.board
+        to_square = move.to_square
 
         # 1. If the move is physically impossible in standard chess geometry
         if self.is_move_physically_impossible(move):
-            announcements.append("Hell no")
-            return False, announcements, None
+            return False, Ann.IMPOSSIBLE, None, None
 
-        # 2. Check if move is fully legal in the ground truth
-        if move not in self.board.legal_moves:
-            announcements.append("No")
-            return False, announcements, None
+        # 2. Check if move is fully legal in the ground truth.
+        # It is already known to be pseudo-legal, so it is legal unless it
+        # leaves our king in check; no second move generation needed.
+        if board.is_into_check(move):
+            return False, Ann.ILLEGAL, None, None
 
-        # Before making the move, let's see if there's a capture
-        piece_captured = None
-        if self.board.is_capture(move):
-            # The piece on the destination might be captured
-            piece_captured = self.board.piece_at(move.to_square)
+        flags = Ann(0)
+        capture_square = None
+
+        # Before making the move, let's see if there's a capture. The piece
+        # type on the destination is all we need, so read it as an int rather
+        # than building a Piece; en passant lands on an empty square but
+        # takes a pawn. Castling never captures, even if it is written as
+        # the king taking its own rook.
+        en_passant = board.is_en_passant(move)
+        castling = not en_passant and board.is_castling(move)
+        captured_type = None if castling else board.piece_type_at(to_square)
 
         # 3. Make the move
-        self.board.push(move)
+        board.push(move)
 
         # 4. Announcements about captures
-        if piece_captured:
-            if piece_captured.piece_type == chess.PAWN:
-                announcements.append(f"Pawn gone on {chess.square_name(move.to_square)}")
-            else:
-                announcements.append(f"Piece gone on {chess.square_name(move.to_square)}")
-
-        # 5. Check for check, checkmate, or stalemate
-        if self.board.is_check():
-            # Determine the direction of check if possible
-            # For simplicity, we do a minimal approach:
-            check_announcement = self.identify_check_direction()
-            announcements.append(check_announcement)
-
-        if self.board.is_game_over():
+        if captured_type == chess.PAWN or en_passant:
+            capture_square = to_square
+            flags |= Ann.CAPTURE_PAWN
+        elif captured_type:
+            capture_square = to_square
+            flags |= Ann.CAPTURE_PIECE
+
+        # 5. Check for check, checkmate, or stalemate.
+        # The checkers bitboard answers "is it check?" and is reused to
+        # find the direction, rather than is_check() and a second scan.
+        checkers = board.checkers_mask()
+        if checkers:
+            # Determine the direction of check
+            flags |= self.identify_check_direction(checkers)
+
+        # One outcome() call decides game over, result and the reason,
+        # instead of re-running the termination checks one by one
+        outcome = board.outcome()
+        if outcome is not None:
             # Could be checkmate, stalemate, etc.
-            result = self.board.result()  # e.g. "1-0", "0-1", "1/2-1/2"
             self.game_over = True
-            self.result = result
-            if self.board.is_checkmate():
-                announcements.append("Checkmate")
-            elif self.board.is_stalemate():
-                announcements.append("Stalemate")
-            elif self.board.is_insufficient_material():
-                announcements.append("Draw by insufficient force")
-            elif self.board.can_claim_draw():
-                announcements.append("Draw by repetition")
-
-        # 6. "White to move" or "Black to move"
-        if not self.game_over:
-            color_move = "White to move" if self.board.turn == chess.WHITE else "Black to move"
-            announcements.append(color_move)
-
-        return True, announcements, move.to_square
-
-    def identify_check_direction(self) -> str:
+            self.result = outcome.result()  # e.g. "1-0", "0-1", "1/2-1/2"
+            flags |= TERMINATION_FLAGS[outcome.termination]
+
+        return True, flags, to_square, capture_square
+
+    def identify_check_direction(self, checkers: chess.Bitboard = None) -> Ann:
         """
-        Returns a string describing the type/direction of check:
-          - "Check on the vertical"
-          - "Check on the horizontal"
-          - "Check on the long diagonal"
-          - "Check on the short diagonal"
-          - "Check by a knight"
-          etc.
-        This is fairly naive logic. 
+        Returns the Ann.CHECK_* flag describing the type/direction of check:
+          - Ann.CHECK_VERT ("Check on the vertical")
+          - Ann.CHECK_HORIZ ("Check on the horizontal")
+          - Ann.CHECK_LONG_DIAG ("Check on the long diagonal")
+          - Ann.CHECK_SHORT_DIAG ("Check on the short diagonal")
+          - Ann.CHECK_KNIGHT ("Check by a knight")
+        Each category is a single AND of the checkers bitboard against a
+        precomputed mask around the king (python-chess's knight-attack,
+        file, rank and diagonal tables), so no per-attacker loop is needed.
+        checkers may be passed in if the caller already has board.checkers_mask().
         """
-        # The king in check is the board.turn's *opponent*'s king
-        # Actually in python-chess, 'turn' is the side *to move* after pushing,
-        # so the checking side is the side that just moved.
-        king_square = self.board.king(not self.board.turn)
+        # In python-chess, 'turn' is the side *to move* after pushing,
+        # so the king in check is board.turn's and the checkers belong
+        # to the side that just moved.
+        king_square = self.board.king(self.board.turn)
         if king_square is None:
-            return "Check"  # fallback if no king found
-
-        # Gather attackers
-        attackers = self.board.attackers(self.board.turn, king_square)
-        # If multiple attackers, just pick one for announcement:
-        for sq in attackers:
-            piece = self.board.piece_at(sq)
-            if piece is not None:
-                if piece.piece_type == chess.KNIGHT:
-                    return "Check by a knight"
-                if piece.piece_type == chess.ROOK:
-                    # vertical/horizontal
-                    file_src = chess.square_file(sq)
-                    rank_src = chess.square_rank(sq)
-                    file_king = chess.square_file(king_square)
-                    rank_king = chess.square_rank(king_square)
-                    if file_src == file_king:
-                        return "Check on the vertical"
-                    else:
-                        return "Check on the horizontal"
-                if piece.piece_type == chess.BISHOP or piece.piece_type == chess.QUEEN:
-                    # diagonal
-                    file_diff = abs(chess.square_file(sq) - chess.square_file(king_square))
-                    rank_diff = abs(chess.square_rank(sq) - chess.square_rank(king_square))
-                    if file_diff == rank_diff:
-                        # Try to guess long vs short diagonal:
-                        # If it's a big distance, call it 'long diagonal'; else 'short diagonal'.
-                        if file_diff >= 3:
-                            return "Check on the long diagonal"
-                        else:
-                            return "Check on the short diagonal"
-                if piece.piece_type == chess.QUEEN:
-                    # If the queen is attacking along file/rank
-                    # we already might have returned above if we recognized rook-like or bishop-like
-                    # but let's do a fallback:
-                    return "Check"
-        return "Check"  # fallback if uncertain
+            return Ann(0)  # no king, no check
+
+        if checkers is None:
+            checkers = self.board.checkers_mask()
+        # Only a knight can give check from a knight-move away
+        if checkers & chess.BB_KNIGHT_ATTACKS[king_square]:
+            return Ann.CHECK_KNIGHT
+        if checkers & chess.BB_FILES[chess.square_file(king_square)]:
+            return Ann.CHECK_VERT
+        if checkers & chess.BB_RANKS[chess.square_rank(king_square)]:
+            return Ann.CHECK_HORIZ
+        # Diagonal attacks on an empty board = both full diagonals through the king
+        diagonal_checkers = checkers & chess.BB_DIAG_ATTACKS[king_square][0]
+        if diagonal_checkers:
+            # If it's a big distance, call it 'long diagonal'; else 'short diagonal'.
+            if DIAG_KIND[chess.msb(diagonal_checkers) * 64 + king_square] == DIAG_LONG:
+                return Ann.CHECK_LONG_DIAG
+            return Ann.CHECK_SHORT_DIAG
+        return Ann(0)  # not in check